@@ -1,4 +1,15 @@
 "Timer generator constants"
 RESOLUTION = (1280, 720)
 FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
-FONT_SIZE = 120
\ No newline at end of file
+FONT_SIZE = 120
+TEXT_PADDING = 20
+TEXT_BOX_ALPHA = 160
+SAMPLE_RATE = 44100
+FRAME_QUEUE_SIZE = 8
+CACHE_FOLDER = ".timer_cache"
+CACHE_VERSION = 1
+CPU_CODEC = "libx264"
+NVENC_CODEC = "h264_nvenc"
+NVENC_PRESET = "p5"
+NVENC_BITRATE = "2M"
+NVENC_MAX_SESSIONS = 2
@@ -1,27 +1,27 @@
 import logging
 import colorlog
 
+_formatter = colorlog.ColoredFormatter(
+    "%(log_color)s %(levelname)s - %(message)s",
+    log_colors={
+        'DEBUG': 'cyan',
+        'INFO': 'green',
+        'WARNING': 'yellow',
+        'ERROR': 'red',
+        'CRITICAL': 'bold_red'
+    }
+)
+_console_handler = logging.StreamHandler()
+_console_handler.setLevel(logging.DEBUG)
+_console_handler.setFormatter(_formatter)
+
 class Logger:
     def __init__(self, name: str):
         self.logger = logging.getLogger(name)
         self.logger.setLevel(logging.DEBUG)
 
-        formatter = colorlog.ColoredFormatter(
-            "%(log_color)s %(levelname)s - %(message)s",
-            log_colors={
-                'DEBUG': 'cyan',
-                'INFO': 'green',
-                'WARNING': 'yellow',
-                'ERROR': 'red',
-                'CRITICAL': 'bold_red'
-            }
-        )
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging.DEBUG)
-        console_handler.setFormatter(formatter)
-
         if not self.logger.hasHandlers():
-            self.logger.addHandler(console_handler)
+            self.logger.addHandler(_console_handler)
 
 
     def info(self, message: str):
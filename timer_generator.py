@@ -1,235 +1,375 @@
 import shutil
+import hashlib
 import argparse
 import os
 import sys
 import re
 import subprocess
+import tempfile
+import threading
+import queue
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont
-from moviepy.editor import ImageSequenceClip, AudioFileClip, VideoFileClip, CompositeVideoClip, concatenate_videoclips, VideoClip
-from pydub import AudioSegment
-from pydub.generators import Sine
-from constants import RESOLUTION, FONT_PATH, FONT_SIZE
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+from constants import RESOLUTION, FONT_PATH, FONT_SIZE, TEXT_PADDING, TEXT_BOX_ALPHA, SAMPLE_RATE, FRAME_QUEUE_SIZE, CACHE_FOLDER, CACHE_VERSION, CPU_CODEC, NVENC_CODEC, NVENC_PRESET, NVENC_BITRATE, NVENC_MAX_SESSIONS
 from logger import Logger
 
 logger = Logger("countdown_generator")
 
-def generate_alarm_sound(output_folder, duration=5, frequency=1000):
+_nvenc_available = None
+_TIMER_RE = re.compile(r'm(\d+)|x(\d+)')
+
+def generate_alarm_sound(output_path, duration=5, frequency=1000):
     """
-    Generate a sine wave alarm sound and save it in the specified folder.
-    - `output_folder`: The folder where the sound will be saved.
+    Generate a sine wave alarm sound and save it as raw PCM (signed 16-bit little-endian,
+    stereo, `SAMPLE_RATE` Hz), which FFmpeg reads without any container to parse.
+    - `output_path`: Path to save the generated alarm sound.
     - `duration`: Length of the alarm in seconds.
     - `frequency`: Frequency of the beep in Hz (default is 1000Hz).
     """
-    os.makedirs(output_folder, exist_ok=True)
-    sound_path = os.path.join(output_folder, "alarm_sound.wav")
-    beep = Sine(frequency).to_audio_segment(duration=duration * 1000)
-    beep.export(sound_path, format="wav")
-    return sound_path
+    t = np.arange(int(SAMPLE_RATE * duration)) / SAMPLE_RATE
+    # -3 dB keeps the level of the former mono WAV, which FFmpeg upmixed to stereo.
+    samples = np.sin(2 * np.pi * frequency * t) / np.sqrt(2)
+    pcm = np.round(samples * 32767).astype("<i2")
+    np.column_stack([pcm, pcm]).tofile(output_path)
 
 
-def prepare_audio(duration, alarm_duration, alarm_sound_path, sound_folder, background_music_path):
+def prepare_audio(duration, alarm_duration, alarm_sound_path, background_music_path, temp_folder):
     """
-    Prepares an audio file with silence matching the timer duration and adds the alarm sound at the end.
-    - `timer_duration`: Duration of the timer in seconds.
+    Prepares the FFmpeg inputs of the audio track: background music (or silence) for the timer
+    duration and the alarm sound at the end. Looping and trimming are done by FFmpeg itself
+    (`-stream_loop -1` plus `-t`), so the music is streamed instead of being decoded into memory.
+    FFmpeg reads an input `-t 0` as "no limit", so a zero-second timer gets no music input at all.
+    - `duration`: Duration of the timer in seconds.
     - `alarm_duration`: Duration of the alarm sound in seconds.
     - `alarm_sound_path`: Path to the alarm sound file.
-    - `sound_folder`: Folder where temporary audio files will be stored.
     - `background_music_path`: Path to music background.
+    - `temp_folder`: Folder for the generated alarm sound.
+    Returns:
+        list of list: FFmpeg input options of each audio segment, in playback order.
     """
-    if background_music_path:
-        bg = AudioSegment.from_file(background_music_path)
-        required_ms = duration * 1000
-        bg_ms = len(bg)
-        if bg_ms < required_ms:
-            loops = required_ms // bg_ms + 1
-            looped_bg = bg * loops
-            bg_segment = looped_bg[:required_ms]
-        else:
-            bg_segment = bg[:required_ms]
+    if not duration:
+        music_input = []
+    elif background_music_path:
+        music_input = ["-stream_loop", "-1", "-t", str(duration), "-i", background_music_path]
     else:
-        bg_segment = AudioSegment.silent(duration=duration * 1000)
+        music_input = ["-f", "lavfi", "-t", str(duration), "-i", f"anullsrc=r={SAMPLE_RATE}:cl=stereo"]
 
     if alarm_sound_path == "alarm.mp3":
-        alarm_sound_path = generate_alarm_sound(sound_folder, duration=alarm_duration)
-    alarm = AudioSegment.from_file(alarm_sound_path)
-    alarm_ms = len(alarm)
-    required_alarm_ms = alarm_duration * 1000
+        alarm_sound_path = os.path.join(temp_folder, "alarm.pcm")
+        generate_alarm_sound(alarm_sound_path, duration=alarm_duration)
+        alarm_input = ["-f", "s16le", "-ar", str(SAMPLE_RATE), "-ac", "2", "-i", alarm_sound_path]
+    else:
+        alarm_input = ["-stream_loop", "-1", "-t", str(alarm_duration), "-i", alarm_sound_path]
 
-    if alarm_ms < required_alarm_ms:
-        loops = required_alarm_ms // alarm_ms + 1
-        alarm = alarm * loops
-    alarm = alarm[:required_alarm_ms]
+    return [segment for segment in (music_input, alarm_input) if segment]
 
-    combined_audio = bg_segment + alarm
-    output_path = os.path.join(sound_folder, "final_audio_with_alarm.wav")
-    combined_audio.export(output_path, format="wav")
-    return output_path
 
-def generate_frame(seconds, output_folder, font, is_alarm=False):
+@lru_cache(maxsize=1)
+def load_font():
     """
-    Generates a sequence of images representing the timer.
-    - `duration`: Timer duration in seconds.
-    - `frame_rate`: Frames per second.
-    - `output_folder`: Folder where frames will be stored.
-    - `alarm_duration`: Duration of alarm frames in seconds.
+    Loads the timer font once per process, falling back to Pillow's default font.
+    Returns:
+        ImageFont: The font shared by the timers rendered in this process.
     """
-    mm, ss = divmod(seconds, 60)
-    filename = f"frame_{mm:02}{ss:02}.png" if not is_alarm else "frame_0000.png"
-    path = os.path.join(output_folder, filename)
+    try:
+        return ImageFont.truetype(FONT_PATH, FONT_SIZE)
+    except OSError:
+        logger.warning("⚠️ Font not found. Using default.")
+        return ImageFont.load_default()
+
 
-    size = (1280, 720)
-    img = Image.new("RGBA", size, (0, 0, 0, 0))
-    draw = ImageDraw.Draw(img)
+@lru_cache(maxsize=1)
+def build_glyph_atlas(font, text_height):
+    """
+    Rasterizes every character a timer can show ("0"-"9" and ":") once as a coverage mask.
+    The atlas is cached per process, so a worker rendering several timers rasterizes it once.
+    - `font`(ImageFont): Font to use for rendering text.
+    - `text_height`(int): Height of the masks, shared by all characters.
+    Returns:
+        dict: Maps each character to its mask, 255 where the glyph fully covers a pixel.
+    """
+    atlas = {}
+    for char in "0123456789:":
+        mask = Image.new("L", (font.getbbox(char)[2], text_height), 0)
+        ImageDraw.Draw(mask).text((0, 0), char, fill=255, font=font)
+        atlas[char] = np.asarray(mask)
+    return atlas
 
-    time_text = f"{mm:02}:{ss:02}" if not is_alarm else "00:00"
-    text_width, text_height = draw.textsize(time_text, font=font)
-    position = ((size[0] - text_width) // 2, (size[1] - text_height) // 2)
 
-    padding = 20
-    draw.rectangle([
-        position[0] - padding,
-        position[1] - padding,
-        position[0] + text_width + padding,
-        position[1] + text_height + padding
-    ], fill=(0, 0, 0, 160))
+def text_color_table(fill):
+    """
+    Builds the lookup table that turns a coverage mask into RGBA pixels: text of color `fill`
+    blended over the translucent black box, the same way Pillow draws text onto it.
+    - `fill`(str): Text color.
+    Returns:
+        np.ndarray: Table of shape (256, 4) indexed by coverage.
+    """
+    coverage = np.arange(256)[:, None]
+    text = np.array(ImageColor.getrgb(fill)[:3] + (255,))
+    box = np.array([0, 0, 0, TEXT_BOX_ALPHA])
+    return ((text * coverage + box * (255 - coverage) + 127) // 255).astype(np.uint8)
 
-    draw.text(position, time_text, fill="red" if is_alarm else "white", font=font)
-    img.save(path)
 
+def timer_frame_renderer(duration, font):
+    """
+    Prepares the countdown layout and returns a function rendering its timer box, one second at a time.
+    - `duration`(int): Duration of the countdown in seconds.
+    - `font`(ImageFont): Font to use for rendering text.
+    Returns:
+        tuple: A function returning the RGBA timer box for the given remaining seconds
+        (0 returns the alarm box), and the (x, y) position of the box in the frame.
+    """
+    digits = "0123456789"
+    mm_digits = max(2, len(str(duration // 60)))
+    # Text is drawn from the pen origin, so the bottom edge gives the room it needs.
+    text_height = font.getbbox("00:00")[3]
+    atlas = build_glyph_atlas(font, text_height)
+
+    digit_advance = round(max(font.getlength(digit) for digit in digits))
+    colon_advance = round(font.getlength(":"))
+    pen_x = [i * digit_advance for i in range(mm_digits + 1)]
+    pen_x += [pen_x[-1] + colon_advance + i * digit_advance for i in range(2)]
+    text_width = pen_x[-1] + max(atlas[digit].shape[1] for digit in digits)
+
+    box_shape = (text_height + 2 * TEXT_PADDING, text_width + 2 * TEXT_PADDING)
+    x = (RESOLUTION[0] - text_width) // 2 - TEXT_PADDING
+    y = (RESOLUTION[1] - text_height) // 2 - TEXT_PADDING
+
+    digit_glyphs = [atlas[digit] for digit in digits]
+    mask = np.zeros(box_shape, dtype=np.uint8)
+
+    def draw(target, glyph, cell):
+        left = TEXT_PADDING + pen_x[cell]
+        region = target[TEXT_PADDING:TEXT_PADDING + text_height, left:left + glyph.shape[1]]
+        np.maximum(region, glyph, out=region)
+
+    @lru_cache(maxsize=1)
+    def minute_mask(minutes):
+        template = np.zeros(box_shape, dtype=np.uint8)
+        for cell in range(mm_digits):
+            place = 10 ** (mm_digits - 1 - cell)
+            # Minutes show at least two digits; extra cells stay blank until they are needed.
+            if place < 100 or minutes >= place:
+                draw(template, digit_glyphs[minutes // place % 10], cell)
+        draw(template, atlas[":"], mm_digits)
+        return template
+
+    def second_mask(second):
+        minutes, seconds = divmod(second, 60)
+        tens, ones = divmod(seconds, 10)
+        np.copyto(mask, minute_mask(minutes))
+        draw(mask, digit_glyphs[tens], mm_digits + 1)
+        draw(mask, digit_glyphs[ones], mm_digits + 2)
+        return mask
+
+    white = text_color_table("white")
+    alarm_box = text_color_table("red")[second_mask(0)]
+
+    def render(second):
+        if second == 0:
+            return alarm_box
+        # Boxes wait in the writer queue while the next one is drawn, so each gets its own array.
+        return white[second_mask(second)]
+
+    return render, (x, y)
+
+
+def seconds_left(t, duration):
+    """
+    Returns the remaining seconds displayed at time `t` of the video.
+    - `t`(float): Time in seconds from the start of the video.
+    - `duration`(int): Duration of the countdown in seconds.
+    Returns:
+        int: Seconds left on the timer, 0 during the whole alarm phase.
+    """
+    return max(0, duration - int(t))
 
 
-def reuse_video(video_path):
+def nvenc_available():
     """
-    Reuses a previously created timer video if it exists.
-    Assumes video files follow the format 'timer_<N>m.mp4' or 'timer_<N>m_<R>.mp4'.
-    If the video is a repetition (e.g., 'timer_5m_2.mp4'), it tries to copy the base version
-    (e.g., 'timer_5m.mp4').
-    - `video_path`(str): Path where the video should be reused/copied to.
+    Checks whether the NVENC hardware encoder can actually be used.
+    The FFmpeg build must list the encoder and a one-frame test encode must succeed,
+    since builds with NVENC support also ship on machines without an NVIDIA GPU.
+    The probe runs once and the result is reused for later calls.
     Returns:
-        bool: True if the video was copied from a base file, False otherwise.
+        bool: True if NVENC can be used for encoding, False otherwise.
     """
-    base_name, ext = os.path.splitext(os.path.basename(video_path))
+    global _nvenc_available
+    if _nvenc_available is None:
+        try:
+            encoders = subprocess.run(
+                ["ffmpeg", "-hide_banner", "-encoders"],
+                capture_output=True, text=True, check=True
+            )
+            _nvenc_available = NVENC_CODEC in encoders.stdout and subprocess.run(
+                ["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "lavfi", "-i", "color=size=256x256",
+                 "-frames:v", "1", "-c:v", NVENC_CODEC, "-f", "null", "-"],
+                capture_output=True
+            ).returncode == 0
+        except (OSError, subprocess.CalledProcessError):
+            _nvenc_available = False
+    return _nvenc_available
+
+
+def select_video_codec(hwaccel="auto", frame_rate=24):
+    """
+    Selects the FFmpeg video encoder options.
+    The CPU encoder runs libx264 with the `ultrafast` preset tuned for still images,
+    since the timer only changes once per second: one keyframe per second and no
+    scene-cut detection keep every other frame a cheap copy of the previous one.
+    Both encoders get the same fixed GOP, so the timers of an expression stay
+    concat-compatible and can be merged by stream copy.
+    - `hwaccel`(str): "cuda" forces NVENC, "none" forces CPU encoding and "auto"
+      uses NVENC only when the FFmpeg probe finds it.
+    - `frame_rate`(int): Frames per second for the video, used as keyframe interval.
+    Returns:
+        list[str]: FFmpeg output options selecting and configuring the video encoder.
+    """
+    gop = ["-g", str(frame_rate), "-keyint_min", str(frame_rate), "-sc_threshold", "0"]
+    if hwaccel == "cuda" or (hwaccel == "auto" and nvenc_available()):
+        logger.info(f"⚡ Using hardware encoder: {NVENC_CODEC}")
+        return [
+            "-c:v", NVENC_CODEC, "-preset", NVENC_PRESET, "-rc", "vbr", "-b:v", NVENC_BITRATE, "-profile:v", "high",
+            *gop
+        ]
+    return ["-c:v", CPU_CODEC, "-preset", "ultrafast", "-tune", "stillimage", *gop]
 
-    match = re.match(r'(timer_\d+m)(?:_\d+)?$', base_name)
-    if match:
-        base_filename = f"{match.group(1)}{ext}"
-        source_path = os.path.join(os.path.dirname(video_path), base_filename)
-        if os.path.exists(source_path):
-            try:
-                shutil.copy(source_path, video_path)
-                logger.info(f"✅ Reused video: {source_path} → {video_path}")
-                return True
-            except OSError as e:
-                logger.error(f"❌ Failed to copy video: {e}")
-                return False
-        else:
-            logger.info(f"ℹ️ Base video not found: {source_path}")
-    return False
 
+def write_video(output_video, timer_boxes, position, total_duration, frame_rate, background, audio_inputs, encoder):
+    """
+    Encodes the video in a single FFmpeg call that composes the timer over its background.
+    Only the timer box is piped to FFmpeg's stdin, as raw RGBA at one frame per second;
+    FFmpeg's overlay filter blends it onto the background, which is scaled and repeated up
+    to `frame_rate` inside FFmpeg, so no full frame ever goes through Python.
+    A writer thread feeds the pipe from a bounded queue, so composing the next boxes
+    overlaps with writing the previous ones while memory stays capped.
+    The audio track is joined from its inputs and encoded in the same FFmpeg call.
+    - `output_video`(str): Path to the output video file.
+    - `timer_boxes`(Iterable): RGBA timer boxes (np.ndarray) for every second of the video, in order.
+    - `position`(tuple): (x, y) position of the timer box in the frame.
+    - `total_duration`(float): Duration of the video in seconds.
+    - `frame_rate`(int): Frames per second for the video.
+    - `background`(tuple): Background input options and filter from `prepare_background`.
+    - `audio_inputs`(list of list): Input options of the audio segments from `prepare_audio`.
+    - `encoder`(list of str): Video encoder options from `select_video_codec`.
+    """
+    timer_boxes = iter(timer_boxes)
+    first_box = next(timer_boxes)
+    background_input, background_filter = background
+    audio_format = f"aformat=sample_rates={SAMPLE_RATE}:channel_layouts=stereo"
+    audio_filter = "".join(f"[{i + 2}:a]{audio_format}[s{i}];" for i in range(len(audio_inputs)))
+    audio_filter += "".join(f"[s{i}]" for i in range(len(audio_inputs)))
+    command = [
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-f", "rawvideo", "-pix_fmt", "rgba", "-s", f"{first_box.shape[1]}x{first_box.shape[0]}",
+        "-framerate", "1", "-i", "pipe:",
+        *background_input,
+        *(option for segment in audio_inputs for option in segment),
+        "-filter_complex",
+        f"[1:v]{background_filter}[bg];[bg][0:v]overlay=x={position[0]}:y={position[1]}[v];"
+        f"{audio_filter}concat=n={len(audio_inputs)}:v=0:a=1[a]",
+        "-map", "[v]", "-map", "[a]", "-t", str(total_duration),
+        *encoder, "-pix_fmt", "yuv420p", "-video_track_timescale", "90000", "-c:a", "aac", output_video
+    ]
+    process = subprocess.Popen(command, stdin=subprocess.PIPE)
+    pending = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
 
-def check_or_generate_frames(duration, frames_folder, font, background_video=None):
+    def feed_ffmpeg():
+        frame = pending.get()
+        while frame is not None:
+            try:
+                process.stdin.write(frame)
+            except BrokenPipeError:
+                # FFmpeg exited; keep draining so the producer never blocks.
+                pass
+            frame = pending.get()
+
+    writer = threading.Thread(target=feed_ffmpeg, daemon=True)
+    writer.start()
+    try:
+        pending.put(np.ascontiguousarray(first_box))
+        for box in timer_boxes:
+            pending.put(np.ascontiguousarray(box))
+    finally:
+        pending.put(None)
+        writer.join()
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+    if process.wait() != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+
+
+def file_signature(path):
     """
-    Checks if all required timer frames exist and generates any missing frames.
-    - `duration`(int): Duration of the countdown in seconds.
-    - `frames_folder`(str):  Directory where the frame images are stored.
-    - `font`(str): Font to use for rendering text.
-    - `background_video`(str or None): If provided, forces regeneration of frames.
-    """
-    os.makedirs(frames_folder, exist_ok=True)
-    required_seconds = list(range(duration, 0, -1))
-    missing = [s for s in required_seconds if not os.path.exists(os.path.join(frames_folder, f"frame_{s//60:02}{s%60:02}.png")) or background_video]
-    alarm_path = os.path.join(frames_folder, "frame_0000.png")
-    if not os.path.exists(alarm_path):
-        missing.append(0)
-
-    if missing:
-        logger.info(f"🖼️ Generating {len(missing)} missing frames...")
-        for s in missing:
-            is_alarm = s == 0
-            generate_frame(s, frames_folder, font, is_alarm=is_alarm)
-
-def load_frame_paths(duration, frames_folder, frame_rate, alarm_duration):
-    """
-    Generates a list of frame image paths representing the countdown and alarm period.
-    For each second in the countdown, it repeats the corresponding frame path based on
-    the specified frame rate. It then appends the alarm frame, repeated to match the 
-    alarm duration in seconds and frame rate.
-    - `duration`(int): Duration of the countdown in seconds.
-    - `frames_folder`(str):  Directory where the frame images are stored.
-    - `frame_rate`(int): Number of frames per second.
-    - `alarm_duration`(int): Duration of the alarm phase in seconds.
+    Describes an input file for cache keys: its path plus its modification time,
+    so an edited file invalidates the cached videos built from it.
+    - `path`(str or None): Path to the file.
     Returns:
-        list[str]: Ordered list of frame image paths representing the full timer video.
-    """
-    countdown = []
-    for s in range(duration, 0, -1):
-        mm, ss = divmod(s, 60)
-        path = os.path.join(frames_folder, f"frame_{mm:02}{ss:02}.png")
-        countdown.extend([path] * frame_rate)
-
-    alarm_path = os.path.join(frames_folder, "frame_0000.png")
-    alarm_frames = [alarm_path] * frame_rate * alarm_duration
-    return countdown + alarm_frames
-
-def create_background_video_clip(background_video, resolution, total_duration):
-    """
-    Loads and processes the background video to fit the target resolution and duration.
-    It resizes and crops the video to match the resolution, and loops or trims it
-    to exactly match the total duration.
-    - `background_video_path`(str): Path to the background video file.
-    - `resolution`(tuple): Target resolution as (width, height).
-    - `total_duration`(float): Total duration the video should last (in seconds).
+        str: Signature of the file, or the bare value when it is not an existing file.
+    """
+    if path and os.path.isfile(path):
+        return f"{os.path.abspath(path)}@{os.path.getmtime(path)}"
+    return str(path)
+
+
+def link_or_copy(source, destination):
+    """
+    Places a file at `destination` as a hard link to `source`, so no bytes are copied.
+    Falls back to a regular copy where hard links are not possible (e.g. across file systems).
+    Only meant for short-lived files: a hard link shares its data, so rewriting either path
+    in place changes both.
+    - `source`(str): Path of the existing file.
+    - `destination`(str): Path to create; an existing file there is replaced.
+    """
+    if os.path.lexists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy(source, destination)
+
+
+def video_cache_path(output_video, *inputs):
+    """
+    Builds the cache location of a timer video from everything that affects its content.
+    Identical timers map to the same file regardless of the requested output filename.
+    Code changes that alter the rendered output must bump `CACHE_VERSION`.
+    - `output_video`(str): Requested output path; only its extension is used.
+    - `inputs`: Values that determine the rendered video (durations, files, encoder...).
     Returns:
-        VideoFileClip: Processed background video clip ready for compositing.
+        str: Path of the cached video inside `CACHE_FOLDER`.
     """
-    logger.info(f"📹 Using background video: {background_video}")
-    bg_video = VideoFileClip(background_video).resize(resolution)
-    bg_w, bg_h = bg_video.size
-    target_w, target_h = resolution
-    bg_ratio = bg_w / bg_h
-    target_ratio = target_w / target_h
-
-    if bg_ratio > target_ratio:
-        new_height = target_h
-        new_width = int(bg_ratio * new_height)
-        bg_video = bg_video.resize(width=new_width, height=new_height)
-        x_center = bg_video.w // 2
-        bg_video = bg_video.crop(x_center=x_center, width=target_w, height=target_h)
-    else:
-        new_width = target_w
-        new_height = int(new_width / bg_ratio)
-        bg_video = bg_video.resize(width=new_width, height=new_height)
-        y_center = bg_video.h // 2
-        bg_video = bg_video.crop(y_center=y_center, width=target_w, height=target_h)
-
-    if bg_video.duration < total_duration:
-        loops = int(total_duration // bg_video.duration) + 1
-        bg_video = concatenate_videoclips([bg_video] * loops).subclip(0, total_duration)
-    else:
-        bg_video = bg_video.subclip(0, total_duration)
+    key = hashlib.sha256("|".join(str(value) for value in inputs).encode()).hexdigest()
+    return os.path.join(CACHE_FOLDER, key[:16] + os.path.splitext(output_video)[1])
 
-    return bg_video
 
-def overlay_timer_on_background(bg_video, frame_files, frame_rate, duration, resolution):
+def prepare_background(background_video, frame_rate, hwaccel="auto"):
     """
-    Creates a VideoClip that overlays timer frames on top of the background video.
-    - `bg_video_clip`(VideoFileClip): : The processed background video clip.
-    - `frame_files`(list of str): List of file paths to timer frame images.
-    - `frame_rate`(int): Frames per second for synchronization.
-    - `resolution`(tuple): Target resolution as (width, height).
+    Prepares the FFmpeg input and filter of the video background: the background video
+    scaled to cover the frame, center-cropped and looped for as long as needed, or a black
+    frame when there is none. Unless `hwaccel` is "none", FFmpeg may decode the background
+    on the GPU (NVDEC, VAAPI, QSV...) and falls back to software decoding on its own.
+    - `background_video`(str or None): Path to the background video file.
+    - `frame_rate`(int): Frames per second for the video.
+    - `hwaccel`(str): Hardware acceleration selection: "auto", "cuda" or "none".
     Returns:
-        CompositeVideoClip: Final video clip with timer frames composited over the background.
+        tuple: FFmpeg input options and the filter turning that input into the background.
     """
-    def make_frame(t):
-        frame_idx = min(int(t * frame_rate), len(frame_files) - 1)
-        timer_img = Image.open(frame_files[frame_idx]).convert("RGBA")
-        bg_frame = bg_video.get_frame(t)
-        bg_img = Image.fromarray(bg_frame).convert("RGBA")
-        return np.array(Image.alpha_composite(bg_img, timer_img).convert("RGB"))
+    width, height = RESOLUTION
+    if not background_video:
+        return ["-f", "lavfi", "-i", f"color=c=black:s={width}x{height}:r={frame_rate}"], "null"
 
-    overlay = VideoClip(make_frame, duration=duration)
-    return CompositeVideoClip([bg_video, overlay], size=resolution)
+    logger.info(f"📹 Using background video: {background_video}")
+    decoder = [] if hwaccel == "none" else ["-hwaccel", "auto"]
+    return (
+        [*decoder, "-stream_loop", "-1", "-i", background_video],
+        f"scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height},"
+        f"setsar=1,fps={frame_rate}"
+    )
 
 def generate_timer_video(
     duration,
@@ -238,10 +378,13 @@ def generate_timer_video(
     alarm_sound="alarm.mp3",
     alarm_duration=5,
     background_music=None,
-    background_video=None
+    background_video=None,
+    hwaccel="auto",
+    encoder=None,
+    encoder_threads=None
 ):
     """
-    Generate a video from timer images and add alarm sound when timer reaches zero.
+    Generate a video from timer frames rendered in memory and add alarm sound when timer reaches zero.
     - `duration`: Timer duration in seconds.
     - `output_video`: Path to the output video file.
     - `frame_rate`: Frames per second for the video.
@@ -249,43 +392,47 @@ def generate_timer_video(
     - `alarm_duration`: Duration of the alarm sound in seconds.
     - `background_music`: Path to background music. 
     - `background_video`: Path to background video. 
+    - `hwaccel`: Video encoder selection: "auto", "cuda" or "none".
+    - `encoder`: Video encoder options from `select_video_codec`; selected from `hwaccel` when omitted.
+    - `encoder_threads`: Threads of the video encoder; FFmpeg uses one per core when omitted.
     """
-    if reuse_video(output_video):
+    encoder = encoder or select_video_codec(hwaccel, frame_rate)
+    cache_path = video_cache_path(
+        output_video, duration, frame_rate, alarm_duration, file_signature(alarm_sound),
+        file_signature(background_music), file_signature(background_video),
+        RESOLUTION, FONT_PATH, FONT_SIZE, TEXT_PADDING, TEXT_BOX_ALPHA, SAMPLE_RATE, " ".join(encoder),
+        CACHE_VERSION
+    )
+    # An existing output is replaced rather than rewritten in place, so any file it shares data with stays intact.
+    if os.path.lexists(output_video):
+        os.remove(output_video)
+    if os.path.exists(cache_path):
+        shutil.copy(cache_path, output_video)
+        logger.info(f"✅ Reused cached video: {cache_path} → {output_video}")
         return
 
-    frames_folder = "timer_frames"
-    sound_folder = "sounds"
-    resolution = RESOLUTION
-
-    os.makedirs(sound_folder, exist_ok=True)
-
-    try:
-        font = ImageFont.truetype(FONT_PATH, FONT_SIZE)
-    except OSError:
-        logger.warning("⚠️ Font not found. Using default.")
-        font = ImageFont.load_default()
+    timer_box, position = timer_frame_renderer(duration, load_font())
 
-    check_or_generate_frames(duration, frames_folder, font, background_video)
-    frame_files = load_frame_paths(duration, frames_folder, frame_rate, alarm_duration)
-    countdown_clip = ImageSequenceClip(frame_files, fps=frame_rate, load_images=False)
+    total_duration = duration + alarm_duration
+    timer_boxes = (timer_box(seconds_left(t, duration)) for t in range(total_duration))
+    background = prepare_background(background_video, frame_rate, hwaccel)
 
-    if background_video:
-        bg_video = create_background_video_clip(background_video, resolution, duration + alarm_duration)
-        final_clip = overlay_timer_on_background(bg_video, frame_files, frame_rate, countdown_clip.duration, resolution)
-    else:
-        final_clip = countdown_clip.set_duration(duration + alarm_duration)
+    with tempfile.TemporaryDirectory() as temp_folder:
+        audio_inputs = prepare_audio(duration, alarm_duration, alarm_sound, background_music, temp_folder)
+        threads = ["-threads", str(encoder_threads)] if encoder_threads else []
+        write_video(output_video, timer_boxes, position, total_duration, frame_rate, background, audio_inputs, encoder + threads)
 
-    audio_path = prepare_audio(duration, alarm_duration, alarm_sound, sound_folder, background_music)
-    final_clip = final_clip.set_audio(AudioFileClip(audio_path))
-    final_clip.write_videofile(output_video, codec="libx264", audio_codec="aac")
-    shutil.rmtree(sound_folder, ignore_errors=True)
+    # Timers of an expression render in parallel, so the cache entry is published atomically.
+    os.makedirs(CACHE_FOLDER, exist_ok=True)
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    shutil.copy(output_video, temp_path)
+    os.replace(temp_path, cache_path)
 
 def parse_timer_expression(expression):
     """
       Parses a timer expression and generates a sequence of timers with corresponding filenames.
     """
-    pattern = r'm(\d+)|x(\d+)'
-    matches = re.findall(pattern, expression)
+    matches = _TIMER_RE.findall(expression)
 
     timers = []
     repeat_sequence = []
@@ -314,6 +461,44 @@ def parse_timer_expression(expression):
 
     return list(zip(timers, file_names))
 
+def generate_timer_sequence(timers, **video_options):
+    """
+    Generates the videos of a parsed timer expression, rendering each distinct duration only once.
+    The distinct durations are independent, so they are rendered in parallel worker processes.
+    The encoder is selected once here: NVENC caps the number of workers at the sessions consumer
+    GPUs allow, and libx264 workers split the CPU cores between them.
+    Repeated durations (e.g. the two 5-minute timers of 'm25m5x2m15') are copied from the first render.
+    - `timers`(list of tuple): (minutes, filename) pairs returned by `parse_timer_expression`.
+    - `video_options`: Extra keyword arguments passed to `generate_timer_video`.
+    """
+    outputs = {}
+    for minutes, filename in timers:
+        outputs.setdefault(minutes, []).append(filename)
+
+    cpu_count = os.cpu_count() or 1
+    encoder = select_video_codec(video_options.get("hwaccel", "auto"), video_options.get("frame_rate", 24))
+    if NVENC_CODEC in encoder:
+        workers = min(len(outputs), NVENC_MAX_SESSIONS)
+        encoder_threads = None
+    else:
+        workers = min(len(outputs), cpu_count)
+        encoder_threads = max(1, cpu_count // workers)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        renders = [
+            executor.submit(
+                generate_timer_video, duration=minutes * 60, output_video=filenames[0],
+                encoder=encoder, encoder_threads=encoder_threads, **video_options
+            )
+            for minutes, filenames in outputs.items()
+        ]
+        for render in renders:
+            render.result()
+
+    for filenames in outputs.values():
+        for filename in filenames[1:]:
+            link_or_copy(filenames[0], filename)
+
 def merge_videos(video_files, output_file="timer.mp4"):
     """
     Merge multiple MP4 video files into a single final video without re-encoding.
@@ -328,7 +513,7 @@ def merge_videos(video_files, output_file="timer.mp4"):
         os.remove(output_file)
 
     command = [
-        "ffmpeg", "-f", "concat", "-safe", "0",
+        "ffmpeg", "-fflags", "+genpts", "-f", "concat", "-safe", "0",
         "-i", list_file, "-c", "copy", output_file
     ]
     subprocess.run(command, check=True)
@@ -341,6 +526,7 @@ def parse_args():
     parser.add_argument("-o", "--outputfile", type=str, default="timer.mp4", help="Output filename for the generated video (default: timer.mp4).")
     parser.add_argument("-bm", "--backgroundmusic", type=str, help="Optional background music file for the timer.")
     parser.add_argument("-bv", "--backgroundvideo", type=str, help="Optional background video file for the timer.")
+    parser.add_argument("-hw", "--hwaccel", type=str, choices=["auto", "cuda", "none"], default="auto", help="Video encoder: 'cuda' for NVENC, 'none' for CPU, 'auto' to detect (default: auto).")
     parser.add_argument("-e", "--expression", type=str, help="Timer expression format (e.g., 'm25m5x2m15' where 'mX' sets minutes and 'xY' sets repetitions).")
 
     return parser.parse_args()
@@ -356,7 +542,8 @@ if __name__ == "__main__":
                 output_video=FILENAME,
                 alarm_sound=args.alarm,
                 background_music=args.backgroundmusic,
-                background_video=args.backgroundvideo
+                background_video=args.backgroundvideo,
+                hwaccel=args.hwaccel
               )
             logger.info(f"🎥 Generated video: {FILENAME}")
         else:
@@ -365,14 +552,13 @@ if __name__ == "__main__":
                 logger.error("❌ No valid timers parsed from expression.")
                 sys.exit(1)
             timers_filenames = [filename for _, filename in timers]
-            for duration, filename in timers:
-                generate_timer_video(
-                    duration=duration * 60,
-                    output_video=filename,
-                    alarm_sound=args.alarm,
-                    background_music=args.backgroundmusic,
-                    background_video=args.backgroundvideo
-                  )
+            generate_timer_sequence(
+                timers,
+                alarm_sound=args.alarm,
+                background_music=args.backgroundmusic,
+                background_video=args.backgroundvideo,
+                hwaccel=args.hwaccel
+              )
             merge_videos(timers_filenames, FILENAME)
             for filename in timers_filenames:
                 os.remove(filename)